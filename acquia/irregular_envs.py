@@ -22,80 +22,234 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import subprocess
-import json
+import argparse
+import hashlib
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, token refreshes are then not serialized
+    fcntl = None
+
 # Load API key and secret from .env file
 load_dotenv()
 
 ACQUIA_API_KEY = os.getenv("ACQUIA_API_KEY")
 ACQUIA_API_SECRET = os.getenv("ACQUIA_API_SECRET")
 
+ACQUIA_API_URL = "https://cloud.acquia.com/api"
+ACQUIA_TOKEN_URL = "https://accounts.acquia.com/api/auth/oauth/token"
+
+# Number of concurrent Cloud API calls when fetching environments
+MAX_WORKERS = 16
+
+# Environments every application is expected to have
+REQUIRED_ENVIRONMENTS = frozenset({"stage", "prod"})
+
+# Cached listings live on disk and are considered fresh for the given number of seconds
+CACHE_DIR = os.path.expanduser("~/.cache/acquia")
+APPLICATIONS_TTL = 3600
+ENVIRONMENTS_TTL = 900
+
+# Bearer tokens are cached on disk and refreshed this many seconds before they expire
+TOKEN_PATH = os.path.join(CACHE_DIR, "token.json")
+TOKEN_EXPIRY_MARGIN = 60
+
+
+class AcquiaClient:
+    """Minimal Acquia Cloud API client reusing a single pooled HTTP session"""
+
+    def __init__(self, api_key, api_secret):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.session = requests.Session()
+        # Retry rate-limited (429) and server-side (5xx) errors with exponential backoff
+        retries = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                        respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.token_lock = threading.Lock()
+
+    def authenticate(self, refresh=False):
+        """Authenticate with the cached bearer token, requesting a new one when it is about to expire or on refresh"""
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Hold an advisory lock so concurrent runs refresh the token only once
+            with open(f"{TOKEN_PATH}.lock", "w") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if refresh and os.path.exists(TOKEN_PATH):
+                    os.remove(TOKEN_PATH)
+                access_token = None if refresh else self.read_token()
+                if not access_token:
+                    access_token = self.request_token()
+        except (OSError, KeyError, ValueError, requests.RequestException) as err:
+            print(f"Error authenticating against the Acquia Cloud API: {err}")
+            return False
+
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+        return True
+
+    def read_token(self):
+        """Read the cached bearer token, returning None when missing, malformed, expired or issued for another key"""
+        try:
+            with open(TOKEN_PATH, "rb") as token_file:
+                token = orjson.loads(token_file.read())
+            if token["api_key"] != self.api_key or time.time() >= token["expires_at"] - TOKEN_EXPIRY_MARGIN:
+                return None
+            return token["access_token"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def request_token(self):
+        """Exchange the API key and secret for a bearer token and cache it on disk"""
+        response = self.session.post(ACQUIA_TOKEN_URL, data={
+            "grant_type": "client_credentials",
+            "client_id": self.api_key,
+            "client_secret": self.api_secret
+        })
+        response.raise_for_status()
+        body = orjson.loads(response.content)
+
+        token = {
+            "api_key": self.api_key,
+            "access_token": body["access_token"],
+            "expires_at": time.time() + body.get("expires_in", 0)
+        }
+        # Temporary files are created with mode 0600, so the token is never readable by other users
+        with tempfile.NamedTemporaryFile("wb", dir=CACHE_DIR, delete=False) as token_file:
+            token_file.write(orjson.dumps(token))
+        os.replace(token_file.name, TOKEN_PATH)
+        return token["access_token"]
+
+    def reauthenticate(self, rejected_authorization):
+        """Replace a bearer token rejected by the API, unless another thread already did"""
+        with self.token_lock:
+            if self.session.headers.get("Authorization") != rejected_authorization:
+                return True
+            return self.authenticate(refresh=True)
+
+    def get(self, path):
+        """Issue a GET against the Cloud API and return the embedded items"""
+        authorization = self.session.headers.get("Authorization")
+        response = self.session.get(f"{ACQUIA_API_URL}/{path}")
+        # The cached token can be revoked before it expires: get a new one and retry once
+        if response.status_code == 401 and self.reauthenticate(authorization):
+            response = self.session.get(f"{ACQUIA_API_URL}/{path}")
+        response.raise_for_status()
+        return orjson.loads(response.content).get("_embedded", {}).get("items", [])
+
 
-def run_acquia_command(command):
-    """Run an Acquia CLI command and return the output"""
+def read_cache(key):
+    """Read a cache entry from disk, returning None when missing or unreadable"""
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=3600)
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Error running command: {command}\n{e.stderr}")
+        with open(os.path.join(CACHE_DIR, f"{key}.json"), "rb") as cache_file:
+            return orjson.loads(cache_file.read())
+    except (OSError, ValueError):
         return None
 
 
-def authenticate():
+def write_cache(key, response_body, ttl):
+    """Atomically write a cache entry to disk"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    generated_at = time.time()
+    entry = {"response_body": response_body, "generated_at": generated_at, "stale_at": generated_at + ttl}
+    with tempfile.NamedTemporaryFile("wb", dir=CACHE_DIR, delete=False) as cache_file:
+        cache_file.write(orjson.dumps(entry))
+    os.replace(cache_file.name, os.path.join(CACHE_DIR, f"{key}.json"))
+
+
+def cached_get(client, path, key, ttl, use_cache=True, stale_ok=False):
+    """Get a Cloud API listing through the disk cache, optionally serving stale data on failure"""
+    # Scope entries to the API key so listings of another account are never served
+    key = f"{hashlib.sha256((client.api_key or '').encode()).hexdigest()[:16]}-{key}"
+    entry = read_cache(key) if use_cache or stale_ok else None
+    if use_cache and entry and time.time() < entry["stale_at"]:
+        return entry["response_body"]
+
+    try:
+        response_body = client.get(path)
+    except requests.RequestException as err:
+        if stale_ok and entry:
+            print(f"Error requesting {path}: {err}. Using cached data from {time.ctime(entry['generated_at'])}.")
+            return entry["response_body"]
+        print(f"Error requesting {path}: {err}")
+        return []
+
+    write_cache(key, response_body, ttl)
+    return response_body
+
+
+def authenticate(client):
     """Authenticate using the Acquia API key and secret"""
-    login_command = [
-        "acli", "auth:login",
-        "--key", ACQUIA_API_KEY,
-        "--secret", ACQUIA_API_SECRET,
-        "--no-interaction"
-    ]
-    return run_acquia_command(login_command)
+    return client.authenticate()
 
 
-def get_applications():
+def get_applications(client, use_cache=True, stale_ok=False):
     """Get a list of applications from Acquia"""
-    command = ["acli", "api:application:list"]
-    output = run_acquia_command(command)
-    return json.loads(output) if output else []
+    return cached_get(client, "applications", "applications", APPLICATIONS_TTL, use_cache, stale_ok)
 
 
-def get_environments(application_uuid):
+def get_environments(client, application_uuid, use_cache=True, stale_ok=False):
     """Get a list of environments for a specific application"""
-    command = ["acli", "api:application:environment-list", application_uuid]
-    output = run_acquia_command(command)
-    return json.loads(output) if output else []
+    return cached_get(client, f"applications/{application_uuid}/environments",
+                      f"environments-{application_uuid}", ENVIRONMENTS_TTL, use_cache, stale_ok)
 
 
 def main():
     """Main entry point of the script"""
+    parser = argparse.ArgumentParser(description="Report Acquia applications missing a stage or prod environment.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore cached listings and always query the Acquia Cloud API.")
+    parser.add_argument("--stale-ok", action="store_true",
+                        help="Fall back to expired cached listings when authentication or the API fails.")
+    args = parser.parse_args()
+    use_cache = not args.no_cache
+
+    client = AcquiaClient(ACQUIA_API_KEY, ACQUIA_API_SECRET)
+
     # Authenticate
     print("Authenticating...")
-    if authenticate():
+    if authenticate(client):
         print("Authenticated successfully!")
-
-        # Get applications
-        applications = get_applications()
-        if applications:
-            print(f"Found {len(applications)} applications.\n")
-            for app in applications:
-                environments = get_environments(app.get("uuid"))
-
-                # Collect environment names
-                environment_names = [env.get("name") for env in environments]
-
-                # Check if "stage" or "prod" is not in the environment list
-                if "stage" not in environment_names or "prod" not in environment_names:
-                    print(f"Application: {app['name']} ({app['uuid']})")
-                    print(f"Environments: {', '.join([f"{env.get('label')} ({env.get('name')})" for env in environments])}\n")
-                else:
-                    print(f"Skipping application: {app['name']}. Environments match.")
-        else:
-            print("No applications found or failed to fetch applications.")
+    elif args.stale_ok:
+        print("Authentication failed. Falling back to cached data.")
     else:
         print("Authentication failed.")
+        return
+
+    # Get applications
+    applications = get_applications(client, use_cache, args.stale_ok)
+    if applications:
+        print(f"Found {len(applications)} applications.\n")
+
+        # Fetch environments for all applications concurrently
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(
+                lambda a: (a, get_environments(client, a.get("uuid"), use_cache, args.stale_ok)), applications))
+
+        for app, environments in results:
+            # Collect environment names
+            environment_names = {env.get("name") for env in environments}
+
+            # Check if any of the required environments is missing
+            if not REQUIRED_ENVIRONMENTS.issubset(environment_names):
+                print(f"Application: {app['name']} ({app['uuid']})")
+                labels = ', '.join([f"{env.get('label')} ({env.get('name')})" for env in environments])
+                print(f"Environments: {labels}\n")
+            else:
+                print(f"Skipping application: {app['name']}. Environments match.")
+    else:
+        print("No applications found or failed to fetch applications.")
 
 
 if __name__ == "__main__":
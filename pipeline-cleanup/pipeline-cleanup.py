@@ -24,11 +24,67 @@ SOFTWARE.
 
 import os
 import argparse
+import asyncio
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from operator import itemgetter
+import orjson
 import requests
-from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.util.retry import Retry
 from azure.devops.connection import Connection
 from msrest.authentication import BasicAuthentication
 
+try:
+    import httpx
+except ImportError:  # Deletions fall back to the thread pool
+    httpx = None
+
+# Number of runs deleted concurrently
+MAX_WORKERS = 16
+
+# Maximum number of deletions queued ahead of the workers while runs are still being listed
+MAX_PENDING = MAX_WORKERS * 4
+
+# Maximum number of lease ids removed by a single bulk delete request
+LEASE_BATCH_SIZE = 100
+
+# Maximum number of in-flight requests when deleting build runs with httpx
+MAX_CONCURRENT_REQUESTS = 64
+
+# httpx defaults to a 5 second timeout, too short for slow build deletions
+REQUEST_TIMEOUT = 300
+CONNECT_TIMEOUT = 30
+
+# Retry policy for throttled (429) and failed (5xx) requests
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class PersonalAccessTokenAuth(AuthBase):
+    """Basic authentication with a personal access token, encoding the Authorization header only once."""
+
+    def __init__(self, personal_access_token):
+        self.header = 'Basic ' + b64encode(f":{personal_access_token}".encode()).decode()
+
+    def __call__(self, request):
+        request.headers['Authorization'] = self.header
+        return request
+
+
+def create_session(personal_access_token):
+    """Create an authenticated, pooled HTTP session that retries throttled (429) and failed (5xx) requests."""
+    session = requests.Session()
+    session.auth = PersonalAccessTokenAuth(personal_access_token)
+    retries = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES,
+                    respect_retry_after_header=True)
+    # One connection per worker plus one for the listing requests issued from the main thread
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS + 1, pool_maxsize=MAX_WORKERS + 1, max_retries=retries)
+    session.mount('https://', adapter)
+    return session
+
 
 def get_connection(organization_url, personal_access_token):
     """Authenticate and connect to the Azure DevOps organization using the SDK."""
@@ -37,20 +93,49 @@ def get_connection(organization_url, personal_access_token):
     return connection
 
 
-def get_release_runs(connection, project, pipeline_id):
-    """Get all release pipeline runs (Classic release pipelines)."""
-    release_client = connection.clients.get_release_client()
-    releases = release_client.get_releases(project=project, definition_id=pipeline_id)
-    return releases
+def submit_bounded(executor, fn, items, max_pending):
+    """Submit fn for each item keeping at most max_pending tasks in flight, yielding (item, future) when done."""
+    pending = {}
+    for item in items:
+        if len(pending) >= max_pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+        pending[executor.submit(fn, item)] = item
+
+    for future in list(pending):
+        yield pending.pop(future), future
+
 
+def iter_release_runs(session, organization, project, pipeline_id):
+    """Iterate over all release pipeline runs (Classic release pipelines), following the continuation token header."""
+    url = f"https://vsrm.dev.azure.com/{organization}/{project}/_apis/release/releases"
+    params = {'definitionId': pipeline_id, 'api-version': '6.0'}
+    while True:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        yield from orjson.loads(response.content).get('value', [])
 
-def get_build_runs(organization, project, pipeline_id, personal_access_token):
-    """Get all build pipeline runs (YAML pipelines)."""
+        continuation_token = response.headers.get('x-ms-continuationtoken')
+        if not continuation_token:
+            break
+        params['continuationToken'] = continuation_token
+
+
+def iter_build_runs(session, organization, project, pipeline_id):
+    """Iterate over all build pipeline runs (YAML pipelines), following the continuation token header."""
     base_url = f"https://dev.azure.com/{organization}/{project}/_apis"
-    url = f"{base_url}/build/builds?definitions={pipeline_id}&api-version=6.0"
-    response = requests.get(url, auth=HTTPBasicAuth('', personal_access_token))
-    response.raise_for_status()
-    return response.json()
+    url = f"{base_url}/build/builds?definitions={pipeline_id}&queryOrder=queueTimeDescending&api-version=6.0"
+    continuation_token = None
+    while True:
+        params = {'continuationToken': continuation_token} if continuation_token else None
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        yield from orjson.loads(response.content).get('value', [])
+
+        continuation_token = response.headers.get('x-ms-continuationtoken')
+        if not continuation_token:
+            break
 
 
 def delete_release(connection, project, run_id):
@@ -60,11 +145,15 @@ def delete_release(connection, project, run_id):
     print(f"Deleted release run: {run_id}")
 
 
-def delete_build(organization, project, run_id, personal_access_token):
+def delete_build(session, organization, project, run_id):
     """Delete a build run (YAML pipelines)."""
     base_url = f"https://dev.azure.com/{organization}/{project}/_apis"
     url = f"{base_url}/build/builds/{run_id}?api-version=6.0"
-    response = requests.delete(url, auth=HTTPBasicAuth('', personal_access_token))
+    response = session.delete(url)
+    # Deleting is idempotent: a run already gone or changed concurrently is not an error
+    if response.status_code in (404, 409):
+        print(f"Build run {run_id} was already deleted or is being modified, Status Code: {response.status_code}")
+        return
     response.raise_for_status()
     if response.status_code == 204:
         print(f"Successfully deleted build run: {run_id}")
@@ -72,32 +161,82 @@ def delete_build(organization, project, run_id, personal_access_token):
         print(f"Failed to delete build run: {run_id}, Status Code: {response.status_code}")
 
 
-def remove_retention_leases(organization, project, run_id, is_release, personal_access_token):
+def delete_build_retention_leases(session, organization, project, lease_ids):
+    """Delete build retention leases in bulk, sending up to LEASE_BATCH_SIZE ids per request."""
+    url = f"https://dev.azure.com/{organization}/{project}/_apis/build/retention/leases"
+    for start in range(0, len(lease_ids), LEASE_BATCH_SIZE):
+        batch = lease_ids[start:start + LEASE_BATCH_SIZE]
+        response = session.delete(url, params={'ids': ','.join(map(str, batch)), 'api-version': '7.1'})
+        if response.ok:
+            continue
+
+        # Retry the batch one lease at a time so a single stale id does not block the others
+        for lease_id in batch:
+            del_response = session.delete(url, params={'ids': lease_id, 'api-version': '7.1'})
+            if del_response.status_code in (404, 409):
+                print(f"Retention lease {lease_id} was already removed")
+                continue
+            del_response.raise_for_status()
+
+
+def remove_pipeline_retention_leases(session, organization, project, pipeline_id):
+    """Remove all retention leases of a build pipeline (YAML pipelines) with one lookup and bulk deletes."""
+    base_url = f"https://dev.azure.com/{organization}/{project}/_apis"
+    url = f"{base_url}/build/retention/leases?definitionId={pipeline_id}&api-version=7.1"
+    response = session.get(url)
+    response.raise_for_status()
+    lease_ids = [lease['leaseId'] for lease in orjson.loads(response.content).get('value', [])]
+
+    if lease_ids:
+        print(f"Found {len(lease_ids)} retention lease(s) for pipeline {pipeline_id}, removing them...")
+        delete_build_retention_leases(session, organization, project, lease_ids)
+
+
+def is_retained(run):
+    """Check whether the run payload reports it as retained, i.e. it may hold retention leases."""
+    return run.get('keepForever', False) or run.get('retainedByRelease', False)
+
+
+def remove_retention_leases(session, organization, project, run, is_release):
     """Remove retention leases using the Leases API."""
+    run_id = run['id']
+    # Skip the lease lookup entirely for runs that are not retained
+    if not is_retained(run):
+        return
+
+    print(f"Run {run_id} is retained. Removing retention leases first.")
     base_url = f"https://dev.azure.com/{organization}/{project}/_apis"
     if is_release:
         url = f"{base_url}/release/releases/{run_id}/retentionleases?api-version=6.0"
     else:
         url = f"{base_url}/build/builds/{run_id}/retentionleases?api-version=6.0"
 
-    response = requests.get(url, auth=HTTPBasicAuth('', personal_access_token))
+    response = session.get(url)
     response.raise_for_status()
-    leases = response.json().get('value', [])
+    leases = orjson.loads(response.content).get('value', [])
 
     if not leases:
         print(f"No retention leases found for run {run_id}")
     else:
         print(f"Found {len(leases)} retention lease(s) for run {run_id}, removing them...")
 
+        if not is_release:
+            delete_build_retention_leases(session, organization, project, [lease['leaseId'] for lease in leases])
+            print(f"Deleted {len(leases)} retention lease(s) for run {run_id}")
+            return
+
         for lease in leases:
             lease_id = lease['leaseId']
             delete_url = f"{url}/{lease_id}?api-version=6.0"
-            del_response = requests.delete(delete_url, auth=HTTPBasicAuth('', personal_access_token))
+            del_response = session.delete(delete_url)
+            if del_response.status_code in (404, 409):
+                print(f"Retention lease {lease_id} for run {run_id} was already removed")
+                continue
             del_response.raise_for_status()
             print(f"Deleted retention lease {lease_id} for run {run_id}")
 
 
-def mark_run_as_retained(organization, project, run_id, is_release, personal_access_token):
+def mark_run_as_retained(session, organization, project, run_id, is_release):
     """Mark a run as retained using the correct payload."""
     base_url = f"https://dev.azure.com/{organization}/{project}/_apis"
     if is_release:
@@ -107,41 +246,204 @@ def mark_run_as_retained(organization, project, run_id, is_release, personal_acc
         url = f"{base_url}/build/builds/{run_id}?api-version=6.0"
         payload = {'daysValid': 36500, 'protectPipeline': True}
 
-    response = requests.patch(url, json=payload, auth=HTTPBasicAuth('', personal_access_token))
+    response = session.patch(url, json=payload)
     response.raise_for_status()
     print(f"Run {run_id} marked as retained with payload: {payload}")
 
 
-def process_runs(connection, organization, project, pipeline_id, pipeline_type, keep, delete_all,
-                 personal_access_token):
+def process_runs(connection, session, organization, project, pipeline_id, pipeline_type, keep, delete_all):
     """Main logic to handle retention and deletion of pipeline runs."""
     if pipeline_type == 'release':
-        runs = get_release_runs(connection, project, pipeline_id)
+        runs = iter_release_runs(session, organization, project, pipeline_id)
         is_release = True
     elif pipeline_type == 'yaml':
-        runs = get_build_runs(organization, project, pipeline_id, personal_access_token)
+        runs = iter_build_runs(session, organization, project, pipeline_id)
         is_release = False
     else:
         raise ValueError("Invalid pipeline_type. Must be either 'release' or 'yaml'.")
 
-    # Sort the runs by buildNumber (most recent first)
-    sorted_runs = sorted(runs['value'], key=lambda x: x['buildNumber'], reverse=True)
-    total_runs = len(sorted_runs)
+    # Build leases are all removed upfront when deleting every run, release leases are removed per run
+    remove_leases = is_release or not delete_all
+
+    def delete_one(run):
+        """Remove the retention leases of a run if needed, then delete it."""
+        if remove_leases:
+            remove_retention_leases(session, organization, project, run, is_release)
+        if is_release:
+            delete_release(connection, project, run['id'])
+        else:
+            delete_build(session, organization, project, run['id'])
 
     # Handle deletion logic
     if delete_all:
-        print(f"Deleting all {total_runs} runs...")
-        for run in sorted_runs:
-            if run.get("keepForever", False):
-                print(f"Run {run['id']} is retained. Removing retention leases first.")
-                remove_retention_leases(organization, project, run['id'], is_release, personal_access_token)
-            if is_release:
-                delete_release(connection, project, run['id'])
-            else:
-                delete_build(organization, project, run['id'], personal_access_token)
+        # Runs are deleted while the remaining pages are still being fetched
+        print("Deleting all runs...")
+        if not is_release:
+            remove_pipeline_retention_leases(session, organization, project, pipeline_id)
     elif keep is not None:
         print(f"Keeping the most recent {keep} runs. Deleting the rest.")
-        # Similar logic as before...
+        # Sort by run id (most recent first): ids are increasing integers, while buildNumber strings
+        # sort lexicographically ('10' < '2')
+        runs = sorted(runs, key=itemgetter('id'), reverse=True)[keep:]
+    else:
+        return
+
+    total_runs = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for run, future in submit_bounded(executor, delete_one, runs, MAX_PENDING):
+            total_runs += 1
+            try:
+                future.result()
+            except Exception as err:
+                print(f"Failed to delete run {run['id']}: {err}")
+    print(f"Processed {total_runs} runs.")
+
+
+def create_async_client(personal_access_token):
+    """Create an authenticated httpx client, multiplexing requests over HTTP/2 when available."""
+    limits = httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS)
+    timeout = httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+    headers = {'Authorization': PersonalAccessTokenAuth(personal_access_token).header}
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout, headers=headers)
+    except ImportError:  # HTTP/2 support requires the httpx[http2] extra
+        return httpx.AsyncClient(limits=limits, timeout=timeout, headers=headers)
+
+
+async def send_async(client, method, url, **kwargs):
+    """Send a request, retrying transport errors and throttled (429) or failed (5xx) responses honouring Retry-After."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response
+
+        retry_after = response.headers.get('Retry-After', '')
+        await asyncio.sleep(int(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * (2 ** attempt))
+
+
+async def iter_build_runs_async(client, organization, project, pipeline_id):
+    """Iterate over all build pipeline runs (YAML pipelines), following the continuation token header."""
+    url = f"https://dev.azure.com/{organization}/{project}/_apis/build/builds"
+    # httpx replaces the URL query string with params instead of merging them, so every parameter goes in params
+    params = {'definitions': pipeline_id, 'queryOrder': 'queueTimeDescending', 'api-version': '6.0'}
+    while True:
+        response = await send_async(client, 'GET', url, params=params)
+        response.raise_for_status()
+        for run in orjson.loads(response.content).get('value', []):
+            yield run
+
+        continuation_token = response.headers.get('x-ms-continuationtoken')
+        if not continuation_token:
+            break
+        params['continuationToken'] = continuation_token
+
+
+async def delete_build_retention_leases_async(client, organization, project, lease_ids):
+    """Delete build retention leases in bulk, sending up to LEASE_BATCH_SIZE ids per request."""
+    url = f"https://dev.azure.com/{organization}/{project}/_apis/build/retention/leases"
+    for start in range(0, len(lease_ids), LEASE_BATCH_SIZE):
+        batch = lease_ids[start:start + LEASE_BATCH_SIZE]
+        response = await send_async(client, 'DELETE', url,
+                                    params={'ids': ','.join(map(str, batch)), 'api-version': '7.1'})
+        if response.is_success:
+            continue
+
+        # Retry the batch one lease at a time so a single stale id does not block the others
+        for lease_id in batch:
+            del_response = await send_async(client, 'DELETE', url, params={'ids': lease_id, 'api-version': '7.1'})
+            if del_response.status_code in (404, 409):
+                print(f"Retention lease {lease_id} was already removed")
+                continue
+            del_response.raise_for_status()
+
+
+async def remove_pipeline_retention_leases_async(client, organization, project, pipeline_id):
+    """Remove all retention leases of a build pipeline (YAML pipelines) with one lookup and bulk deletes."""
+    url = f"https://dev.azure.com/{organization}/{project}/_apis/build/retention/leases"
+    response = await send_async(client, 'GET', url, params={'definitionId': pipeline_id, 'api-version': '7.1'})
+    response.raise_for_status()
+    lease_ids = [lease['leaseId'] for lease in orjson.loads(response.content).get('value', [])]
+
+    if lease_ids:
+        print(f"Found {len(lease_ids)} retention lease(s) for pipeline {pipeline_id}, removing them...")
+        await delete_build_retention_leases_async(client, organization, project, lease_ids)
+
+
+async def delete_build_async(client, organization, project, run, remove_leases=True):
+    """Remove the retention leases of a build run (YAML pipelines) if needed, then delete it."""
+    run_id = run['id']
+    base_url = f"https://dev.azure.com/{organization}/{project}/_apis"
+
+    if remove_leases and is_retained(run):
+        print(f"Run {run_id} is retained. Removing retention leases first.")
+        response = await send_async(client, 'GET', f"{base_url}/build/builds/{run_id}/retentionleases",
+                                    params={'api-version': '6.0'})
+        response.raise_for_status()
+        lease_ids = [lease['leaseId'] for lease in orjson.loads(response.content).get('value', [])]
+        await delete_build_retention_leases_async(client, organization, project, lease_ids)
+        print(f"Deleted {len(lease_ids)} retention lease(s) for run {run_id}")
+
+    response = await send_async(client, 'DELETE', f"{base_url}/build/builds/{run_id}", params={'api-version': '6.0'})
+    # Deleting is idempotent: a run already gone or changed concurrently is not an error
+    if response.status_code in (404, 409):
+        print(f"Build run {run_id} was already deleted or is being modified, Status Code: {response.status_code}")
+        return
+    response.raise_for_status()
+    print(f"Successfully deleted build run: {run_id}")
+
+
+async def process_build_runs_async(client, organization, project, pipeline_id, keep, delete_all):
+    """Handle deletion of build pipeline runs (YAML pipelines) on a single event loop."""
+    # Bounded so that listing never runs more than MAX_PENDING runs ahead of the deletions
+    pending_runs = asyncio.Queue(maxsize=MAX_PENDING)
+    total_runs = 0
+
+    async def worker():
+        nonlocal total_runs
+        while True:
+            run = await pending_runs.get()
+            if run is None:
+                return
+            total_runs += 1
+            try:
+                # Leases were already removed for the whole pipeline when deleting every run
+                await delete_build_async(client, organization, project, run, remove_leases=not delete_all)
+            except Exception as err:
+                print(f"Failed to delete run {run['id']}: {err}")
+
+    async with client:
+        runs = iter_build_runs_async(client, organization, project, pipeline_id)
+        if delete_all:
+            print("Deleting all runs...")
+            await remove_pipeline_retention_leases_async(client, organization, project, pipeline_id)
+        elif keep is not None:
+            print(f"Keeping the most recent {keep} runs. Deleting the rest.")
+        else:
+            return
+
+        workers = [asyncio.create_task(worker()) for _ in range(MAX_CONCURRENT_REQUESTS)]
+        try:
+            if delete_all:
+                # Runs are deleted while the remaining pages are still being fetched
+                async for run in runs:
+                    await pending_runs.put(run)
+            else:
+                sorted_runs = sorted([run async for run in runs], key=itemgetter('id'), reverse=True)
+                for run in sorted_runs[keep:]:
+                    await pending_runs.put(run)
+        finally:
+            for _ in workers:
+                await pending_runs.put(None)
+            await asyncio.gather(*workers)
+
+    print(f"Processed {total_runs} runs.")
 
 
 # CLI entry point
@@ -159,16 +461,24 @@ def main():
                         help="Number of most recent runs to keep. The remaining runs will be deleted.")
 
     args = parser.parse_args()
+    if args.keep is not None and args.keep < 0:
+        parser.error("--keep must be zero or a positive number of runs.")
+
     personal_access_token = os.getenv('AZURE_DEVOPS_PAT')
 
     if not personal_access_token:
         raise EnvironmentError("Please set the AZURE_DEVOPS_PAT environment variable.")
 
-    organization_url = f"https://dev.azure.com/{args.organization}"
-    connection = get_connection(organization_url, personal_access_token)
-
-    process_runs(connection, args.organization, args.project, args.pipeline_id, args.pipeline_type, args.keep, args.all,
-                 personal_access_token)
+    if httpx and args.pipeline_type == 'yaml':
+        client = create_async_client(personal_access_token)
+        asyncio.run(process_build_runs_async(client, args.organization, args.project, args.pipeline_id, args.keep,
+                                             args.all))
+    else:
+        organization_url = f"https://dev.azure.com/{args.organization}"
+        connection = get_connection(organization_url, personal_access_token)
+        session = create_session(personal_access_token)
+        process_runs(connection, session, args.organization, args.project, args.pipeline_id, args.pipeline_type,
+                     args.keep, args.all)
 
 
 # Allow both module import and CLI usage
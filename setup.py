@@ -32,12 +32,17 @@ setup(
         "requests",
         "azure-devops",
         "msrest",
+        "orjson",
         "python-dotenv"
     ],
+    extras_require={
+        "async": ["httpx[http2]"]
+    },
     entry_points={
         "console_scripts": [
             "pipeline-cleanup=azure_devops.pipeline_cleanup:main",
             "user-management=azure_devops.user_management:main",
+            "user-management-refresh-users=azure_devops.refresh_users:main",
             "acquia-irregular-envs=acquia.irregular_envs:main"
         ]
     },
@@ -0,0 +1,116 @@
+import importlib.util
+import json
+import os
+
+import pytest
+import requests
+
+MODULE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "acquia", "irregular_envs.py")
+spec = importlib.util.spec_from_file_location("irregular_envs", MODULE_PATH)
+irregular_envs = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(irregular_envs)
+
+
+class StubClient:
+    """Client returning its own API key as the listing, or failing like an unreachable API."""
+
+    def __init__(self, api_key, fail=False):
+        self.api_key = api_key
+        self.fail = fail
+        self.calls = 0
+
+    def get(self, path):
+        self.calls += 1
+        if self.fail:
+            raise requests.ConnectionError("unreachable")
+        return [{"name": self.api_key}]
+
+
+class StubResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+class StubSession:
+    """Session accepting only the bearer token it last issued from the token endpoint."""
+
+    def __init__(self, token_body):
+        self.headers = {}
+        self.token_body = token_body
+        self.issued = []
+
+    def post(self, url, data):
+        self.issued.append(f"token-{len(self.issued)}")
+        return StubResponse(200, {**self.token_body, "access_token": self.issued[-1]} if self.token_body else {})
+
+    def get(self, url):
+        if not self.issued or self.headers.get("Authorization") != f"Bearer {self.issued[-1]}":
+            return StubResponse(401, {})
+        return StubResponse(200, {"_embedded": {"items": [{"name": "app"}]}})
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(irregular_envs, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(irregular_envs, "TOKEN_PATH", str(tmp_path / "token.json"))
+
+
+def stub_acquia_client(token_body):
+    client = irregular_envs.AcquiaClient("key-a", "secret")
+    client.session = StubSession(token_body)
+    return client
+
+
+def test_cached_listing_is_reused_for_the_same_api_key():
+    client = StubClient("key-a")
+
+    assert irregular_envs.get_applications(client) == [{"name": "key-a"}]
+    assert irregular_envs.get_applications(client) == [{"name": "key-a"}]
+    assert client.calls == 1
+
+
+def test_cache_keys_are_scoped_to_the_api_key():
+    irregular_envs.get_applications(StubClient("key-a"))
+    other = StubClient("key-b")
+
+    assert irregular_envs.get_applications(other) == [{"name": "key-b"}]
+    assert other.calls == 1
+
+
+def test_stale_fallback_never_serves_another_accounts_listing():
+    irregular_envs.get_applications(StubClient("key-a"))
+
+    assert irregular_envs.get_applications(StubClient("key-b", fail=True), stale_ok=True) == []
+    assert irregular_envs.get_applications(StubClient("key-a", fail=True), use_cache=False,
+                                           stale_ok=True) == [{"name": "key-a"}]
+
+
+def test_revoked_cached_token_is_replaced_once():
+    with open(irregular_envs.TOKEN_PATH, "w") as token_file:
+        json.dump({"api_key": "key-a", "access_token": "revoked", "expires_at": 2 ** 40}, token_file)
+    client = stub_acquia_client({"expires_in": 3600})
+
+    assert client.authenticate()
+    assert client.get("applications") == [{"name": "app"}]
+    assert client.get("applications") == [{"name": "app"}]
+    assert client.session.issued == ["token-0"]
+    assert client.read_token() == "token-0"
+
+
+def test_malformed_cached_token_is_ignored():
+    with open(irregular_envs.TOKEN_PATH, "w") as token_file:
+        json.dump({"api_key": "key-a"}, token_file)
+    client = stub_acquia_client({"expires_in": 3600})
+
+    assert client.read_token() is None
+    assert client.authenticate()
+    assert client.session.issued == ["token-0"]
+
+
+def test_token_response_without_access_token_fails_authentication():
+    assert stub_acquia_client(None).authenticate() is False
@@ -0,0 +1,246 @@
+import asyncio
+import importlib.util
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+pytest.importorskip("azure.devops")
+requires_httpx = pytest.mark.skipif(httpx is None, reason="httpx is not installed")
+
+MODULE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "pipeline-cleanup", "pipeline-cleanup.py")
+spec = importlib.util.spec_from_file_location("pipeline_cleanup", MODULE_PATH)
+pipeline_cleanup = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pipeline_cleanup)
+
+
+class StubResponse:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode() if body is not None else b''
+        self.headers = headers or {}
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class StubSession:
+    """Records requests and answers them with a handler(method, url, params)."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def request(self, method, url, params=None, **kwargs):
+        params = dict(params or {})
+        self.requests.append((method, url, params))
+        return self.handler(method, url, params)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+def test_iter_release_runs_follows_continuation_tokens():
+    def handler(method, url, params):
+        if 'continuationToken' in params:
+            return StubResponse(body={'value': [{'id': 3}]})
+        return StubResponse(body={'value': [{'id': 1}, {'id': 2}]}, headers={'x-ms-continuationtoken': 'tok'})
+
+    session = StubSession(handler)
+    runs = list(pipeline_cleanup.iter_release_runs(session, 'org', 'proj', 42))
+
+    assert [run['id'] for run in runs] == [1, 2, 3]
+    assert len(session.requests) == 2
+    for _, url, params in session.requests:
+        assert url == 'https://vsrm.dev.azure.com/org/proj/_apis/release/releases'
+        assert params['definitionId'] == 42
+    assert 'continuationToken' not in session.requests[0][2]
+    assert session.requests[1][2]['continuationToken'] == 'tok'
+
+
+def test_submit_bounded_limits_in_flight_tasks_and_drains_all_items():
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+    consumed = []
+
+    def task(item):
+        with lock:
+            in_flight.append(item)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(item)
+        return item * 2
+
+    def items():
+        for item in range(20):
+            consumed.append(item)
+            yield item
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = pipeline_cleanup.submit_bounded(executor, task, items(), 3)
+        item, future = next(results)
+        # Items are pulled lazily: only one more than the bound before the first result
+        assert len(consumed) <= 4
+        finished = [(item, future.result())] + [(item, future.result()) for item, future in results]
+
+    assert max(peak) <= 3
+    assert sorted(finished) == [(item, item * 2) for item in range(20)]
+
+
+def build_runs_handler(method, url, params):
+    """Serve build runs 2, 10, 9 and 1 (10 retained) with one lease per run, and accept every delete."""
+    if method == 'DELETE':
+        return StubResponse(204)
+    if '/build/builds?' in url:
+        return StubResponse(body={'value': [{'id': 2}, {'id': 10, 'keepForever': True}, {'id': 9}, {'id': 1}]})
+    if 'retention/leases?definitionId=' in url:
+        return StubResponse(body={'value': [{'leaseId': 100 + run_id} for run_id in (2, 10, 9, 1)]})
+    if url.endswith('/retentionleases?api-version=6.0'):
+        return StubResponse(body={'value': [{'leaseId': 110}]})
+    raise AssertionError(f"Unexpected request: {method} {url}")
+
+
+def deleted_build_ids(session):
+    return sorted(int(url.split('/')[-1].split('?')[0]) for method, url, _ in session.requests
+                  if method == 'DELETE' and '/build/builds/' in url)
+
+
+def test_process_runs_all_removes_pipeline_leases_once_before_deleting():
+    session = StubSession(build_runs_handler)
+    pipeline_cleanup.process_runs(None, session, 'org', 'proj', 7, 'yaml', None, True)
+
+    lease_lookups = [url for method, url, _ in session.requests if method == 'GET' and 'lease' in url]
+    assert lease_lookups == ['https://dev.azure.com/org/proj/_apis/build/retention/leases?definitionId=7&api-version=7.1']
+    lease_deletes = [params['ids'] for method, url, params in session.requests
+                     if method == 'DELETE' and url.endswith('/build/retention/leases')]
+    assert lease_deletes == ['102,110,109,101']
+    assert deleted_build_ids(session) == [1, 2, 9, 10]
+
+
+def test_process_runs_keep_deletes_oldest_runs_by_id_and_only_their_leases():
+    session = StubSession(build_runs_handler)
+    pipeline_cleanup.process_runs(None, session, 'org', 'proj', 7, 'yaml', 1, False)
+
+    # Run 10 is the newest by integer id, even though '9' > '10' as strings
+    assert deleted_build_ids(session) == [1, 2, 9]
+    assert not any('definitionId=' in url for _, url, _ in session.requests)
+    # None of the deleted runs is retained, so no per-run lease lookup is made
+    assert not any('retentionleases' in url for _, url, _ in session.requests)
+
+
+def test_process_runs_keep_removes_leases_of_retained_runs():
+    session = StubSession(build_runs_handler)
+    pipeline_cleanup.process_runs(None, session, 'org', 'proj', 7, 'yaml', 0, False)
+
+    assert deleted_build_ids(session) == [1, 2, 9, 10]
+    lease_lookups = [url for method, url, _ in session.requests if method == 'GET' and 'lease' in url]
+    assert lease_lookups == ['https://dev.azure.com/org/proj/_apis/build/builds/10/retentionleases?api-version=6.0']
+    assert [params['ids'] for method, url, params in session.requests
+            if method == 'DELETE' and url.endswith('/build/retention/leases')] == ['110']
+
+
+@requires_httpx
+def test_iter_build_runs_async_keeps_filters_on_every_page():
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        if 'continuationToken' in request.url.params:
+            return httpx.Response(200, json={'value': [{'id': 3}]})
+        return httpx.Response(200, json={'value': [{'id': 1}, {'id': 2}]}, headers={'x-ms-continuationtoken': 'tok'})
+
+    async def collect():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return [run async for run in pipeline_cleanup.iter_build_runs_async(client, 'org', 'proj', 42)]
+
+    runs = asyncio.run(collect())
+
+    assert [run['id'] for run in runs] == [1, 2, 3]
+    assert len(requests_seen) == 2
+    for request in requests_seen:
+        assert request.url.path == '/org/proj/_apis/build/builds'
+        assert request.url.params['definitions'] == '42'
+        assert request.url.params['queryOrder'] == 'queueTimeDescending'
+        assert request.url.params['api-version'] == '6.0'
+    assert requests_seen[1].url.params['continuationToken'] == 'tok'
+
+
+@requires_httpx
+def test_send_async_retries_transport_errors(monkeypatch):
+    monkeypatch.setattr(pipeline_cleanup, 'BACKOFF_FACTOR', 0)
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("connection reset", request=request)
+        return httpx.Response(204)
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await pipeline_cleanup.send_async(client, 'DELETE', 'https://dev.azure.com/org/proj/_apis/x')
+
+    assert asyncio.run(send()).status_code == 204
+    assert len(attempts) == 3
+
+
+@requires_httpx
+def test_delete_build_retention_leases_async_retries_rejected_batch_per_lease():
+    deleted_ids = []
+
+    def handler(request):
+        ids = request.url.params['ids']
+        if ',' in ids or ids == '2':
+            return httpx.Response(404)
+        deleted_ids.append(ids)
+        return httpx.Response(204)
+
+    async def delete():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await pipeline_cleanup.delete_build_retention_leases_async(client, 'org', 'proj', [1, 2, 3])
+
+    asyncio.run(delete())
+
+    assert deleted_ids == ['1', '3']
+
+
+@requires_httpx
+def test_process_build_runs_async_deletes_all_listed_runs(monkeypatch):
+    monkeypatch.setattr(pipeline_cleanup, 'MAX_PENDING', 2)
+    deleted_runs = []
+
+    def handler(request):
+        if request.method == 'GET' and request.url.path.endswith('/build/builds'):
+            if 'continuationToken' in request.url.params:
+                return httpx.Response(200, json={'value': [{'id': i} for i in range(5, 10)]})
+            return httpx.Response(200, json={'value': [{'id': i} for i in range(5)]},
+                                  headers={'x-ms-continuationtoken': 'tok'})
+        if request.method == 'GET':
+            return httpx.Response(200, json={'value': []})
+        deleted_runs.append(int(request.url.path.rsplit('/', 1)[-1]))
+        return httpx.Response(204)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    asyncio.run(pipeline_cleanup.process_build_runs_async(client, 'org', 'proj', 42, None, True))
+
+    assert sorted(deleted_runs) == list(range(10))
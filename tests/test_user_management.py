@@ -0,0 +1,80 @@
+import importlib.util
+import os
+import threading
+import time
+from contextlib import closing
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("azure.devops")
+
+MODULE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "user-management", "user_management.py")
+spec = importlib.util.spec_from_file_location("user_management", MODULE_PATH)
+user_management = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(user_management)
+
+
+class StubGraphClient:
+    """Graph client serving an endless listing of one-user pages."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def list_users(self, continuation_token=None):
+        with self.lock:
+            self.calls += 1
+            page = self.calls
+        return SimpleNamespace(graph_users=[page], continuation_token=str(page))
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_management, "USER_INDEX_DIR", str(tmp_path))
+
+
+def test_index_upserts_descriptors():
+    assert user_management.index_user_descriptors("org", [[("a@example.com", "old")], [("b@example.com", "b")]]) == 2
+    assert user_management.index_user_descriptors("org", [[("a@example.com", "new")]]) == 1
+
+    assert user_management.get_indexed_descriptor("org", "a@example.com") == "new"
+    assert user_management.get_indexed_descriptor("org", "b@example.com") == "b"
+
+
+def test_index_ignores_entries_older_than_ttl(monkeypatch):
+    monkeypatch.setattr(time, "time", lambda: 1_000_000)
+    user_management.index_user_descriptors("org", [[("a@example.com", "a")]])
+
+    monkeypatch.setattr(time, "time", lambda: 1_000_000 + user_management.USER_INDEX_TTL - 1)
+    assert user_management.get_indexed_descriptor("org", "a@example.com") == "a"
+
+    monkeypatch.setattr(time, "time", lambda: 1_000_000 + user_management.USER_INDEX_TTL)
+    assert user_management.get_indexed_descriptor("org", "a@example.com") is None
+
+
+def test_index_commits_pages_written_before_a_listing_error():
+    def pages():
+        yield [("a@example.com", "a")]
+        raise RuntimeError("listing failed")
+
+    with pytest.raises(RuntimeError):
+        user_management.index_user_descriptors("org", pages())
+
+    assert user_management.get_indexed_descriptor("org", "a@example.com") == "a"
+
+
+def test_iter_user_pages_stops_prefetching_when_closed_early():
+    graph_client = StubGraphClient()
+    threads = set(threading.enumerate())
+
+    with closing(user_management.iter_user_pages(graph_client)) as pages:
+        assert next(pages) == [1]
+        producers = set(threading.enumerate()) - threads
+
+    assert producers
+    for producer in producers:
+        producer.join(timeout=1)
+    # The producer exits instead of blocking forever on the full prefetch queue
+    assert not any(producer.is_alive() for producer in producers)
+    assert graph_client.calls <= user_management.PREFETCH_PAGES + 2
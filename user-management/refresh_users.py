@@ -0,0 +1,66 @@
+"""
+MIT License
+
+Copyright (c) 2024 Dennis A. Torres <d70rr3s@gmail.com>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import os
+import sys
+from user_management import get_connection, index_user_descriptors, iter_user_pages
+
+
+def iter_user_entries(connection):
+    """Yield one list of (email, descriptor) entries per page of users, keyed by both principal name and mail address"""
+    graph_client = connection.clients.get_graph_client()
+    for graph_users in iter_user_pages(graph_client):
+        yield [(email, user.descriptor)
+               for user in graph_users
+               for email in {(user.principal_name or '').lower(), (user.mail_address or '').lower()}
+               if email]
+
+
+# CLI entry point
+def main():
+    """Main function to rebuild the user descriptor index via CLI (e.g. from a cron job)."""
+    parser = argparse.ArgumentParser(description="Refresh the Azure DevOps user descriptor index.")
+    parser.add_argument("--organization", required=True, help="Azure DevOps organization name.")
+    args = parser.parse_args()
+
+    personal_access_token = os.getenv('AZURE_DEVOPS_PAT')
+    if not personal_access_token:
+        raise EnvironmentError("Please set the AZURE_DEVOPS_PAT environment variable.")
+
+    organization_url = f"https://dev.azure.com/{args.organization}"
+    connection = get_connection(organization_url, personal_access_token)
+
+    print(f"Refreshing user index for organization: {args.organization}")
+    try:
+        indexed = index_user_descriptors(args.organization, iter_user_entries(connection))
+    except Exception as err:
+        # Pages indexed before the failure stay committed
+        print(f"An error occurred while listing users: {err}")
+        sys.exit(1)
+    print(f"Indexed {indexed} user entries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,33 +22,170 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+import orjson
 import requests
 from azure.devops.connection import Connection
 from msrest.authentication import BasicAuthentication
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 
 load_dotenv()
 
+# Size of the HTTP connection pool shared by all REST calls
+POOL_SIZE = 32
 
-def get_user_descriptor(connection, user_email):
-    """Get the user descriptor by email (with pagination)"""
-    graph_client = connection.clients.get_graph_client()
+# Number of team memberships removed concurrently
+MAX_WORKERS = 8
+
+# Number of user pages fetched ahead while the current page is being scanned
+PREFETCH_PAGES = 2
+
+# Persistent email -> descriptor index, one SQLite database per organization
+USER_INDEX_DIR = os.path.expanduser("~/.cache/ado-users")
+USER_INDEX_TTL = 7 * 24 * 3600
+
+
+def open_user_index(organization):
+    """Open (and create if needed) the user descriptor index of an organization"""
+    os.makedirs(USER_INDEX_DIR, exist_ok=True)
+    index = sqlite3.connect(os.path.join(USER_INDEX_DIR, f"{organization}.sqlite"))
+    # WAL lets a refresh run while lookups keep reading
+    index.execute("PRAGMA journal_mode=WAL")
+    index.execute("CREATE TABLE IF NOT EXISTS users "
+                  "(email TEXT PRIMARY KEY, descriptor TEXT NOT NULL, updated_at INTEGER NOT NULL)")
+    return index
+
+
+def get_indexed_descriptor(organization, user_email):
+    """Get a user descriptor from the index, ignoring entries older than USER_INDEX_TTL"""
+    try:
+        with closing(open_user_index(organization)) as index:
+            row = index.execute("SELECT descriptor FROM users WHERE email = ? AND updated_at > ?",
+                                (user_email, int(time.time()) - USER_INDEX_TTL)).fetchone()
+            return row[0] if row else None
+
+    except sqlite3.Error as err:
+        print(f"An error occurred while reading the user index: {err}")
+        return None
 
+
+def index_user_descriptors(organization, pages):
+    """Upsert pages of (email, descriptor) entries in the index, committing each page, and return how many were written"""
+    updated_at = int(time.time())
+    written = 0
+    try:
+        with closing(open_user_index(organization)) as index:
+            # Pages are fetched outside the transaction so no write lock is held during network I/O
+            for entries in pages:
+                with index:
+                    cursor = index.executemany(
+                        "INSERT INTO users (email, descriptor, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(email) DO UPDATE SET descriptor = excluded.descriptor, updated_at = excluded.updated_at",
+                        [(email, descriptor, updated_at) for email, descriptor in entries])
+                    written += cursor.rowcount
+        return written
+
+    except sqlite3.Error as err:
+        print(f"An error occurred while updating the user index: {err}")
+        return written
+
+
+def query_user_descriptor(session, organization, user_email):
+    """Look up the user descriptor by email server side using the Graph subject query"""
+    base_url = f"https://vssps.dev.azure.com/{organization}/_apis"
+    url = f"{base_url}/graph/subjectquery?api-version=7.1-preview.1"
+    response = session.post(url, json={'query': user_email, 'subjectKind': ['User']})
+    response.raise_for_status()
+
+    for subject in orjson.loads(response.content).get('value', []):
+        if user_email in ((subject.get('principalName') or '').lower(), (subject.get('mailAddress') or '').lower()):
+            return subject['descriptor']
+    return None
+
+
+def iter_user_pages(graph_client):
+    """Yield pages of graph users while the following pages are prefetched on a background thread"""
+    pages = queue.Queue(maxsize=PREFETCH_PAGES)
+    cancelled = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up as soon as the consumer stops iterating instead of blocking on a full queue
+        while not cancelled.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            continuation_token = None
+            while not cancelled.is_set():
+                # Query users with pagination token
+                users = graph_client.list_users(continuation_token=continuation_token)
+                put(users.graph_users)
+
+                # Check if there's more data to fetch
+                continuation_token = users.continuation_token
+                if not continuation_token:
+                    break
+            put(done)
+        except Exception as err:
+            put(err)
+
+    threading.Thread(target=produce, daemon=True).start()
     try:
-        continuation_token = None
         while True:
-            # Query users with pagination token
-            users = graph_client.list_users(continuation_token=continuation_token)
+            page = pages.get()
+            if page is done:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        cancelled.set()
+
+
+def get_user_descriptor(connection, session, organization, user_email):
+    """Get the user descriptor by email from the index, the Graph subject query or listing users (with pagination)"""
+    user_email = user_email.lower()
+
+    user_descriptor = get_indexed_descriptor(organization, user_email)
+    if user_descriptor:
+        return user_descriptor
 
-            for user in users.graph_users:
-                if str.lower(user.principal_name) == user_email or str.lower(user.mail_address) == user_email:
-                    return user.descriptor
+    try:
+        user_descriptor = query_user_descriptor(session, organization, user_email)
+        if user_descriptor:
+            index_user_descriptors(organization, [[(user_email, user_descriptor)]])
+        else:
+            print(f"No user found with email: {user_email}")
+        return user_descriptor
 
-            # Check if there's more data to fetch
-            continuation_token = users.continuation_token
-            if not continuation_token:
-                break
+    except requests.RequestException as err:
+        print(f"Graph subject query failed, falling back to listing all users: {err}")
+
+    graph_client = connection.clients.get_graph_client()
+
+    try:
+        with closing(iter_user_pages(graph_client)) as pages:
+            for graph_users in pages:
+                for user in graph_users:
+                    if (user.principal_name or '').lower() == user_email or (user.mail_address or '').lower() == user_email:
+                        index_user_descriptors(organization, [[(user_email, user.descriptor)]])
+                        return user.descriptor
 
         print(f"No user found with email: {user_email}")
         return None
@@ -77,31 +214,48 @@ def get_user_memberships(connection, user_descriptor):
         return []
 
 
-def get_team_details(connection, container_descriptor):
-    """Get a team details using a container descriptor"""
-    graph_client = connection.clients.get_graph_client()
-
+def get_teams_details(session, organization, container_descriptors):
+    """Get the details of several teams in a single Graph subject lookup, keyed by container descriptor"""
     try:
-        team = graph_client.get_group(container_descriptor)
-        return team
+        base_url = f"https://vssps.dev.azure.com/{organization}/_apis"
+        url = f"{base_url}/graph/subjectlookup?api-version=7.1-preview.1"
+        lookup_keys = [{'descriptor': descriptor} for descriptor in container_descriptors]
+        response = session.post(url, json={'lookupKeys': lookup_keys})
+        response.raise_for_status()
+        return orjson.loads(response.content).get('value', {})
 
     except Exception as err:
         print(f"An error occurred while retrieving team details: {err}")
-        return None
+        return {}
 
 
-def remove_user_from_team(organization, user_descriptor, team_descriptor, personal_access_token):
-    """Remove a user from a specific team"""
+def remove_user_from_team(session, organization, user_descriptor, team_descriptor):
+    """Remove a user from a specific team, returning whether it succeeded"""
     try:
         base_url = f"https://vssps.dev.azure.com/{organization}/_apis"
         url = f"{base_url}/graph/memberships/{user_descriptor}/{team_descriptor}?api-version=7.2-preview.1"
-        response = requests.delete(url, auth=HTTPBasicAuth('', personal_access_token))
+        response = session.delete(url)
         response.raise_for_status()
-        if response.status_code == 200:
-            print(f"Successfully removed user from team: {team_descriptor}")
+        return True
 
     except Exception as err:
-        print(f"An error occurred while removing user from team: {err}")
+        print(f"An error occurred while removing user from team {team_descriptor}: {err}")
+        return False
+
+
+def remove_user_from_teams(session, organization, user_descriptor, teams):
+    """Remove a user from several teams concurrently and print a summary of the results"""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        removed = executor.map(
+            lambda team: remove_user_from_team(session, organization, user_descriptor, team['descriptor']), teams)
+        results = dict(zip([team['details']['principalName'] for team in teams], removed))
+
+    for team_name, success in results.items():
+        if success:
+            print(f"Successfully removed user from team: {team_name}")
+        else:
+            print(f"Failed to remove user from team: {team_name}")
+    return results
 
 
 def get_connection(organization_url, personal_access_token):
@@ -111,15 +265,55 @@ def get_connection(organization_url, personal_access_token):
     return connection
 
 
+def create_session(personal_access_token):
+    """Create an authenticated, pooled HTTP session that retries throttled (429) and failed (5xx) requests."""
+    session = requests.Session()
+    session.auth = HTTPBasicAuth('', personal_access_token)
+    retries = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                    respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retries)
+    session.mount('https://', adapter)
+    return session
+
+
+def prompt_teams(teams):
+    """Ask once whether to remove the user from all teams, otherwise ask for each team individually"""
+    all_teams_response = input(f"Do you want to remove the user from ALL {len(teams)} teams? (yes/no): ").strip().lower()
+    if all_teams_response == 'yes' or all_teams_response == 'y':
+        return teams
+
+    selected_teams = []
+    for team in teams:
+        team_response = input(
+            f"Do you want to remove the user from {team['details']['principalName']}? (yes/no): ").strip().lower()
+        if team_response == 'yes' or team_response == 'y':
+            selected_teams.append(team)
+        else:
+            print(f"Skipping removal from {team['details']['principalName']}.")
+    return selected_teams
+
+
+def team_pattern(value):
+    """Compile the --teams regular expression, letting argparse report invalid patterns as usage errors"""
+    try:
+        return re.compile(value)
+    except re.error as err:
+        raise ValueError(err) from err
+
+
 # CLI entry point
 def main():
     """Main function to run the script via CLI."""
     import argparse
-    import os
 
     parser = argparse.ArgumentParser(description="Azure DevOps User Management Tool")
     parser.add_argument("--organization", required=True, help="Azure DevOps organization name.")
     parser.add_argument("--user_email", required=True, help="The email address of the user.")
+    parser.add_argument("--teams", type=team_pattern, help="Regular expression; only teams whose name matches are removed.")
+    parser.add_argument("--yes", action="store_true",
+                        help="Remove the user from all (matching) teams without prompting.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only list the teams the user would be removed from.")
     args = parser.parse_args()
 
     personal_access_token = os.getenv('AZURE_DEVOPS_PAT')
@@ -128,37 +322,42 @@ def main():
 
     organization_url = f"https://dev.azure.com/{args.organization}"
     connection = get_connection(organization_url, personal_access_token)
+    session = create_session(personal_access_token)
 
     print(f"Fetching data for user: {args.user_email}")
-    user_descriptor = get_user_descriptor(connection, args.user_email)
+    user_descriptor = get_user_descriptor(connection, session, args.organization, args.user_email)
     if user_descriptor:
         print(f"User descriptor found: {user_descriptor}")
         memberships = get_user_memberships(connection, user_descriptor)
 
         if memberships:
+            container_descriptors = [membership.container_descriptor for membership in memberships]
+            teams_details = get_teams_details(session, args.organization, container_descriptors)
+
             teams = []
-            for membership in memberships:
-                container_descriptor = membership.container_descriptor
-                team = get_team_details(connection, container_descriptor)
-                if team:
+            for container_descriptor in container_descriptors:
+                team = teams_details.get(container_descriptor)
+                if team and (not args.teams or args.teams.search(team['principalName'])):
                     teams.append(dict(descriptor=container_descriptor, details=team))
-                    print(f"User is a member of team: {team.principal_name}")
-
-            # Ask the user if they want to remove the user from all teams or individually
-            all_teams_response = input("Do you want to remove the user from ALL teams? (yes/no): ").strip().lower()
-            if all_teams_response == 'yes' or all_teams_response == 'y':
-                # Remove the user from all teams
-                for team in teams:
-                    remove_user_from_team(args.organization, user_descriptor, team['descriptor'], personal_access_token)
+                    print(f"User is a member of team: {team['principalName']}")
+
+            if not teams:
+                print("No teams to remove the user from.")
+                return
+            if args.dry_run:
+                print(f"Dry run: the user would be removed from {len(teams)} team(s).")
+                return
+
+            if args.yes:
+                # Remove the user from all listed teams without prompting
+                selected_teams = teams
+            elif not sys.stdin.isatty():
+                print("Not running interactively. Use --yes to remove the user from the listed teams.")
+                return
             else:
-                # Iterate through each team and ask if they should be removed individually
-                for team in teams:
-                    team_response = input(
-                        f"Do you want to remove the user from {team['details'].principal_name}? (yes/no): ").strip().lower()
-                    if team_response == 'yes' or team_response == 'y':
-                        remove_user_from_team(args.organization, user_descriptor, team['descriptor'], personal_access_token)
-                    else:
-                        print(f"Skipping removal from {team['details'].principal_name}.")
+                selected_teams = prompt_teams(teams)
+
+            remove_user_from_teams(session, args.organization, user_descriptor, selected_teams)
 
 
 if __name__ == "__main__":